@@ -0,0 +1,280 @@
+-- Tables used by main.py on top of the original Supabase schema
+-- (users, inventory, exports, ton_quan, sale_quan, pizza_sales, ...).
+-- Idempotent: run it in the Supabase SQL editor after deploying a version
+-- that needs a new table.
+
+-- Saved cake check results, read by /api/store/cake/reconciliation
+create table if not exists cake_checks (
+    id bigserial primary key,
+    store_id text not null,
+    date date not null,
+    "user" text,
+    base_l_yesterday integer,
+    base_s_yesterday integer,
+    base_l_today integer,
+    base_s_today integer,
+    base_l_out integer,
+    base_s_out integer,
+    base_l_discard integer,
+    base_s_discard integer,
+    base_l_machine integer,
+    base_s_machine integer,
+    l_actual integer,
+    s_actual integer,
+    l_diff integer,
+    s_diff integer,
+    created_at timestamp not null default now()
+);
+create index if not exists cake_checks_store_date on cake_checks (store_id, date);
+
+-- Factory inventory journal (/api/inventory/as-of): signed deltas, or the
+-- new absolute quantity for source 'set', plus periodic full snapshots
+create table if not exists inventory_movements (
+    id bigserial primary key,
+    item text not null,
+    quantity numeric not null,
+    source text not null,
+    created_at timestamp not null default now()
+);
+create index if not exists inventory_movements_created_at on inventory_movements (created_at);
+
+create table if not exists inventory_checkpoints (
+    id bigserial primary key,
+    snapshot jsonb not null,
+    created_at timestamp not null default now()
+);
+create index if not exists inventory_checkpoints_created_at on inventory_checkpoints (created_at);
+
+-- Apply factory inventory movements and journal them in one transaction.
+-- p_items: [{"item", "quantity", "product_id"}]; quantity is a signed delta,
+-- or the new absolute quantity for p_source 'set'. The movement is stamped
+-- with the clock while the transaction holds its inventory row lock, so a
+-- checkpoint (which waits for that lock) always falls on one side of it.
+create or replace function apply_inventory_movements(p_items jsonb, p_source text)
+returns setof inventory
+language plpgsql as $$
+declare
+    move jsonb;
+begin
+    for move in select * from jsonb_array_elements(p_items) loop
+        return query
+        insert into inventory as inv (item, quantity, product_id)
+        values (move->>'item', (move->>'quantity')::numeric, (move->>'product_id')::bigint)
+        on conflict (item) do update
+            set quantity = case when p_source = 'set' then excluded.quantity
+                                else inv.quantity + excluded.quantity end,
+                product_id = coalesce(excluded.product_id, inv.product_id)
+        returning inv.*;
+
+        insert into inventory_movements (item, quantity, source, created_at)
+        values (move->>'item', (move->>'quantity')::numeric, p_source, clock_timestamp()::timestamp);
+    end loop;
+end;
+$$;
+
+-- Snapshot the factory inventory. Share mode waits for in-flight inventory
+-- writes and holds off new ones, so the snapshot and its timestamp describe
+-- the same moment.
+create or replace function create_inventory_checkpoint()
+returns setof inventory_checkpoints
+language plpgsql as $$
+begin
+    lock table inventory in share mode;
+    return query
+    insert into inventory_checkpoints (snapshot, created_at)
+    select coalesce(jsonb_object_agg(item, quantity), '{}'::jsonb), clock_timestamp()::timestamp
+    from inventory
+    returning *;
+end;
+$$;
+
+-- Delta sync change log (/api/sync); id is the client cursor
+create table if not exists sync_changes (
+    id bigserial primary key,
+    table_name text not null,
+    row_key text not null,
+    store_id text,
+    op text not null default 'upsert',
+    row jsonb,
+    created_at timestamp not null default now()
+);
+create index if not exists sync_changes_created_at on sync_changes (created_at);
+create index if not exists sync_changes_store_id on sync_changes (store_id, id);
+
+-- Newest ton_quan snapshot of every store (/api/store/inventory/latest,
+-- reorder suggestions, archive), upserted on each snapshot write
+create table if not exists ton_quan_latest (
+    store_id text primary key,
+    ton_quan_id bigint,
+    date date,
+    inventory jsonb,
+    username text,
+    created_at timestamp
+);
+
+-- Upsert snapshots into ton_quan_latest, replacing a store's row only with a
+-- newer one: a buffered count flushed late, or a slower overlapping write,
+-- never rolls the index back
+create or replace function index_latest_inventory(p_rows jsonb)
+returns void
+language sql as $$
+    insert into ton_quan_latest as latest (store_id, ton_quan_id, date, inventory, username, created_at)
+    select r.store_id, r.ton_quan_id, r.date, r.inventory, r.username, r.created_at
+    from jsonb_to_recordset(p_rows)
+        as r(store_id text, ton_quan_id bigint, date date, inventory jsonb, username text, created_at timestamp)
+    on conflict (store_id) do update
+    set ton_quan_id = excluded.ton_quan_id,
+        date = excluded.date,
+        inventory = excluded.inventory,
+        username = excluded.username,
+        created_at = excluded.created_at
+    where latest.created_at is null or excluded.created_at > latest.created_at;
+$$;
+
+-- Archive tier: one entry per table and archived month (the file in the
+-- ARCHIVE_BUCKET storage bucket); status goes 'uploaded' -> 'complete' once
+-- the month's rows are purged from the hot table
+create table if not exists archive_manifest (
+    id bigserial primary key,
+    table_name text not null,
+    month date not null,
+    path text not null,
+    rows integer not null,
+    min_date date,
+    max_date date,
+    sha256 text not null,
+    status text not null default 'uploaded',
+    created_at timestamp not null default now(),
+    completed_at timestamp,
+    unique (table_name, month)
+);
+
+-- Idempotency keys of write-buffer / store closing submissions: inserts are
+-- upserts on write_key wherever the column exists, so a replayed batch that
+-- had already landed adds no rows
+alter table sale_quan add column if not exists write_key text unique;
+alter table ton_quan add column if not exists write_key text unique;
+alter table pizza_sales add column if not exists write_key text unique;
+alter table order_quan add column if not exists write_key text unique;
+
+-- Product catalog: every product gets an integer id; product_aliases maps
+-- other names and every spelling seen so far onto a product (keys are NFC,
+-- collapsed whitespace, casefold, see product_key in main.py). One row per
+-- spelling, so several rows can share an alias_key; /api/products/aliases
+-- remaps all of them together, so a key always names one product
+create table if not exists products (
+    id bigserial primary key,
+    name text not null,
+    name_key text not null unique,
+    created_at timestamp not null default now()
+);
+
+create table if not exists product_aliases (
+    alias text primary key,
+    alias_key text not null,
+    product_id bigint not null references products (id),
+    created_at timestamp not null default now()
+);
+create index if not exists product_aliases_alias_key on product_aliases (alias_key);
+
+-- Rows written with a product_id wherever the column exists
+alter table inventory add column if not exists product_id bigint references products (id);
+alter table raw_materials_input add column if not exists product_id bigint references products (id);
+alter table production add column if not exists product_id bigint references products (id);
+alter table exports add column if not exists product_id bigint references products (id);
+alter table pizza_sales add column if not exists product_id bigint references products (id);
+
+-- Amount of a revenue channel in a sale_quan row (as jsonb): the first of the
+-- given columns holding a number, 0 when none does (ColumnMap.values in main.py)
+create or replace function revenue_amount(r jsonb, names jsonb)
+returns numeric
+language sql immutable as $$
+    select coalesce((
+        select (r->>n.name)::numeric
+        from jsonb_array_elements_text(names) with ordinality as n(name, i)
+        where r->>n.name ~ '^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)\s*$'
+        order by n.i
+        limit 1
+    ), 0)
+$$;
+
+-- Revenue corrections (/api/store/revenue/batch-update) in one transaction.
+-- p_changes: [{"store_id", "date", "field", "amount"}] applied in order to the
+-- latest sale_quan row of each store-day; p_channels: correctable column ->
+-- the columns its channel is read from. Rows are locked in a fixed order, so
+-- overlapping batches queue instead of deadlocking. Raises no_data_found
+-- (P0002) listing the store-days without a row. Returns {"changes": [...old /
+-- new amount], "totals": [...old / new total_revenue]}.
+create or replace function apply_revenue_changes(p_changes jsonb, p_channels jsonb)
+returns jsonb
+language plpgsql as $$
+declare
+    target record;
+    change jsonb;
+    before jsonb;
+    targets jsonb := '{}';
+    missing text[] := '{}';
+    results jsonb := '[]';
+    totals jsonb := '[]';
+    row_id bigint;
+    new_total numeric;
+begin
+    for target in
+        select distinct c->>'store_id' as store_id, c->>'date' as day
+        from jsonb_array_elements(p_changes) as c
+        order by 1, 2
+    loop
+        select to_jsonb(s) into before
+        from sale_quan s
+        where s.store_id = target.store_id and s.date = target.day::date
+        order by s.created_at desc nulls last, s.id desc
+        limit 1
+        for update;
+        if before is null then
+            missing := missing || (target.store_id || ' ' || target.day);
+        else
+            targets := targets || jsonb_build_object(
+                target.store_id || ' ' || target.day,
+                jsonb_build_object('id', before->'id', 'store_id', target.store_id, 'date', target.day,
+                                   'old_total', coalesce((before->>'total_revenue')::numeric, 0))
+            );
+        end if;
+    end loop;
+    if cardinality(missing) > 0 then
+        raise exception using errcode = 'P0002', message = array_to_string(missing, ', ');
+    end if;
+
+    for change in select * from jsonb_array_elements(p_changes) loop
+        if not p_channels ? (change->>'field') then
+            raise exception using errcode = '22023', message = 'invalid revenue field ' || (change->>'field');
+        end if;
+        row_id := (targets #>> array[(change->>'store_id') || ' ' || (change->>'date'), 'id'])::bigint;
+        select to_jsonb(s) into before from sale_quan s where s.id = row_id;
+        results := results || jsonb_build_array(jsonb_build_object(
+            'store_id', change->'store_id',
+            'date', change->'date',
+            'revenue_type', change->'field',
+            'old_amount', revenue_amount(before, p_channels->(change->>'field')),
+            'new_amount', change->'amount'
+        ));
+        execute format('update sale_quan set %I = $1 where id = $2', change->>'field')
+        using (change->>'amount')::numeric, row_id;
+    end loop;
+
+    for target in select value from jsonb_each(targets) loop
+        update sale_quan s
+        set total_revenue = (
+            select sum(revenue_amount(to_jsonb(s), c.names)) from jsonb_each(p_channels) as c(field, names)
+        )
+        where s.id = (target.value->>'id')::bigint
+        returning s.total_revenue into new_total;
+        totals := totals || jsonb_build_array(jsonb_build_object(
+            'store_id', target.value->'store_id',
+            'date', target.value->'date',
+            'old_total', target.value->'old_total',
+            'new_total', new_total
+        ));
+    end loop;
+    return jsonb_build_object('changes', results, 'totals', totals);
+end;
+$$;